@@ -1,172 +1,548 @@
+import hashlib
+import io
 import math
 import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from flask import Flask, render_template, request, redirect, url_for, flash
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from shapely.geometry import Polygon
-from svgpathtools import svg2paths2, parse_path
+from shapely import wkb
+from shapely.geometry import GeometryCollection, Polygon
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+from svgpathtools import Arc
 from lxml import etree
 
+# Numba is optional, without it the flattening kernel runs as plain Python
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda func: func
+
 # Setup
 app = Flask(__name__)
 app.secret_key = 'banana'
 UPLOAD_FOLDER = 'static/uploads'
 SVG_FILENAME = 'uploaded.svg'
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 stored_svg_path = os.path.join(UPLOAD_FOLDER, SVG_FILENAME)
+SHAPES_ARTIFACT_SUFFIX = '.wkb'
 CIRCLE_SAMPLES = 1000
-ELLIPSE_SAMPLES = 1000
 CURVE_SAMPLES = 1000
+CURVE_TOLERANCE = 3e-4
+MAX_SUBDIVISION_DEPTH = 16
+MIN_CURVE_EXTENT = 1e-3
+AREA_CACHE_SIZE = 8
+SHAPE_TAGS = ("rect", "circle", "ellipse", "path")
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+
+# Depth must be digits with at most one decimal point, a leading '.' is padded with '0' first
+_DEPTH_RE = re.compile(r'\A\d+\.?\d*\Z')
+
+# Path data tokens, each skipping any leading whitespace and comma separators
+_PATH_COMMAND_RE = re.compile(r'[\s,]*([MmLlHhVvCcSsQqTtAaZz])')
+_PATH_NUMBER_RE = re.compile(r'[\s,]*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+_PATH_FLAG_RE = re.compile(r'[\s,]*([01])')
+_PATH_END_RE = re.compile(r'[\s,]*\Z')
+
+# Worker threads shared by every parse, so concurrent requests don't each start their own pool
+_parse_pool = ThreadPoolExecutor(max_workers=PARSE_WORKERS)
+
+# Signed areas of recently calculated SVGs keyed by a digest of their contents, oldest first
+_area_cache = {}
+_area_cache_lock = threading.Lock()
 
-# Bezier parse function using t as the scale
-def bezier_point(p0, p1, p2, p3, t):
-    return (
-        (1 - t) ** 3 * p0
-        + 3 * (1 - t) ** 2 * t * p1
-        + 3 * (1 - t) * t ** 2 * p2
-        + t ** 3 * p3
+# Unit circle samples shared by every circle and ellipse
+_ANGLES = np.linspace(0.0, 2 * np.pi, CIRCLE_SAMPLES + 1)
+_COS, _SIN = np.cos(_ANGLES), np.sin(_ANGLES)
+
+# Curve parameter values shared by every sampled arc and quadratic Bezier
+_T = np.linspace(0.0, 1.0, CURVE_SAMPLES + 1)
+
+# Quadratic Bernstein basis as an (N+1)x3 matrix, so each segment is sampled with one matrix product
+_QUAD_BZ = np.empty((CURVE_SAMPLES + 1, 3))
+_QUAD_BZ[:, 0] = (1 - _T) ** 2
+_QUAD_BZ[:, 1] = 2 * (1 - _T) * _T
+_QUAD_BZ[:, 2] = _T ** 2
+
+# Flatten a cubic Bezier into line segments by de Casteljau subdivision, compiled by Numba when available
+# The flatness tolerance scales with the control polygon's bounding box so small curves stay detailed
+# Writes the start point and the end point of each flat piece into the (N, 2) out buffer from row n onwards
+# and returns the row after the last one written, or -1 if the buffer filled up before the curve was done
+@njit(cache=True, fastmath=True, nogil=True)
+def flatten_cubic(x0, y0, x1, y1, x2, y2, x3, y3, tol_scale, max_depth, out, n):
+    tol = tol_scale * (
+        (max(x0, x1, x2, x3) - min(x0, x1, x2, x3))
+        + (max(y0, y1, y2, y3) - min(y0, y1, y2, y3))
     )
 
-# Parse svg from filepath into a list of nested polygons
+    # Explicit stack of pending sub-curves, the left half is always processed first
+    stack = np.empty((max_depth + 2, 8))
+    depths = np.empty(max_depth + 2, dtype=np.int64)
+    stack[0, 0], stack[0, 1], stack[0, 2], stack[0, 3] = x0, y0, x1, y1
+    stack[0, 4], stack[0, 5], stack[0, 6], stack[0, 7] = x2, y2, x3, y3
+    depths[0] = 0
+    top = 1
+    if n >= out.shape[0]:
+        return -1
+    out[n, 0] = x0
+    out[n, 1] = y0
+    n += 1
+    while top > 0:
+        top -= 1
+        x0, y0, x1, y1 = stack[top, 0], stack[top, 1], stack[top, 2], stack[top, 3]
+        x2, y2, x3, y3 = stack[top, 4], stack[top, 5], stack[top, 6], stack[top, 7]
+        depth = depths[top]
+
+        # Emit the end point once the piece is flat enough to be a straight line
+        flatness = (
+            math.hypot(2 * x1 - x0 - x2, 2 * y1 - y0 - y2)
+            + math.hypot(2 * x2 - x1 - x3, 2 * y2 - y1 - y3)
+        )
+        if flatness <= tol or depth >= max_depth:
+            if n >= out.shape[0]:
+                return -1
+            out[n, 0] = x3
+            out[n, 1] = y3
+            n += 1
+            continue
+
+        # Split at t=0.5
+        x01, y01 = (x0 + x1) / 2, (y0 + y1) / 2
+        x12, y12 = (x1 + x2) / 2, (y1 + y2) / 2
+        x23, y23 = (x2 + x3) / 2, (y2 + y3) / 2
+        x012, y012 = (x01 + x12) / 2, (y01 + y12) / 2
+        x123, y123 = (x12 + x23) / 2, (y12 + y23) / 2
+        xm, ym = (x012 + x123) / 2, (y012 + y123) / 2
+
+        # Push the right half first so the left half is popped next
+        stack[top, 0], stack[top, 1], stack[top, 2], stack[top, 3] = xm, ym, x123, y123
+        stack[top, 4], stack[top, 5], stack[top, 6], stack[top, 7] = x23, y23, x3, y3
+        depths[top] = depth + 1
+        top += 1
+        stack[top, 0], stack[top, 1], stack[top, 2], stack[top, 3] = x0, y0, x01, y01
+        stack[top, 4], stack[top, 5], stack[top, 6], stack[top, 7] = x012, y012, xm, ym
+        depths[top] = depth + 1
+        top += 1
+    return n
+
+# Copy the filled rows of a point buffer into a larger one with room for at least need more rows
+def grow_buffer(buf, idx, need):
+    grown = np.empty((max(2 * len(buf), idx + need), 2))
+    grown[:idx] = buf[:idx]
+    return grown
+
+# Taxicab diagonal of the bounding box around a set of complex points
+def taxicab_extent(points):
+    xs = [p.real for p in points]
+    ys = [p.imag for p in points]
+    return (max(xs) - min(xs)) + (max(ys) - min(ys))
+
+# Size of a curve segment from its control polygon, arcs also count their radii as they can bulge past their end points
+def curve_extent(seg):
+    if seg[0] == 'A':
+        radius = seg[2]
+        return taxicab_extent((seg[1], seg[-1])) + 2 * (radius.real + radius.imag)
+    return taxicab_extent(seg[1:])
+
+# Parse svg path data into a list of subpaths, each a list of segment tuples of complex points
+# Relative, shorthand, horizontal and vertical commands are all resolved to absolute segments:
+# ('L', start, end), ('Q', start, control, end), ('C', start, control1, control2, end)
+# and ('A', start, radius, rotation, large_arc, sweep, end)
+def parse_path_segments(d):
+    subpaths = []
+    segments = []
+    pos = 0
+    current = start = 0j
+    command = None
+    last_control = None
+
+    def read(pattern):
+        nonlocal pos
+        match = pattern.match(d, pos)
+        if not match:
+            raise ValueError(f"Invalid path data at position {pos}")
+        pos = match.end()
+        return match.group(1)
+
+    def number():
+        return float(read(_PATH_NUMBER_RE))
+
+    def point(relative):
+        p = complex(number(), number())
+        return current + p if relative else p
+
+    while not _PATH_END_RE.match(d, pos):
+
+        # A missing command letter repeats the previous command with a new set of parameters
+        match = _PATH_COMMAND_RE.match(d, pos)
+        if match:
+            command = match.group(1)
+            pos = match.end()
+        elif command is None or command in 'Zz':
+            raise ValueError(f"Invalid path data at position {pos}")
+        relative = command.islower()
+        kind = command.upper()
+
+        # Move starts a new subpath, any further coordinate pairs are implicit lines
+        # A move onto the current point of an open subpath continues it, as in chained M..L outlines
+        if kind == 'M':
+            end = point(relative)
+            if segments and end != current:
+                subpaths.append(segments)
+                segments = []
+            current = start = end
+            command = 'l' if relative else 'L'
+            last_control = None
+            continue
+
+        # Close the subpath with a straight line back to its start
+        if kind == 'Z':
+            if current != start:
+                segments.append(('L', current, start))
+            if segments:
+                subpaths.append(segments)
+            segments = []
+            current = start
+            last_control = None
+            continue
+
+        if kind == 'L':
+            end = point(relative)
+            segments.append(('L', current, end))
+            control = None
+        elif kind == 'H':
+            x = number()
+            end = complex(current.real + x if relative else x, current.imag)
+            segments.append(('L', current, end))
+            control = None
+        elif kind == 'V':
+            y = number()
+            end = complex(current.real, current.imag + y if relative else y)
+            segments.append(('L', current, end))
+            control = None
+        elif kind in 'CS':
+
+            # Smooth curves reflect the previous cubic's second control point
+            if kind == 'C':
+                control1 = point(relative)
+            elif last_control is not None and last_control[0] == 'C':
+                control1 = 2 * current - last_control[1]
+            else:
+                control1 = current
+            control2 = point(relative)
+            end = point(relative)
+            segments.append(('C', current, control1, control2, end))
+            control = ('C', control2)
+        elif kind in 'QT':
+
+            # Smooth curves reflect the previous quadratic's control point
+            if kind == 'Q':
+                control1 = point(relative)
+            elif last_control is not None and last_control[0] == 'Q':
+                control1 = 2 * current - last_control[1]
+            else:
+                control1 = current
+            end = point(relative)
+            segments.append(('Q', current, control1, end))
+            control = ('Q', control1)
+        else:
+
+            # Arcs with a zero radius are straight lines and arcs ending where they start are dropped
+            rx = abs(number())
+            ry = abs(number())
+            rotation = number()
+            large_arc = read(_PATH_FLAG_RE) == '1'
+            sweep = read(_PATH_FLAG_RE) == '1'
+            end = point(relative)
+            if rx == 0 or ry == 0:
+                segments.append(('L', current, end))
+            elif end != current:
+                segments.append(('A', current, complex(rx, ry), rotation, large_arc, sweep, end))
+            control = None
+
+        current = end
+        last_control = control
+
+    if segments:
+        subpaths.append(segments)
+    return subpaths
+
+# Build the polygons approximating a single svg element, a path may produce one per subpath
+# Runs on worker threads so it only reads module constants and allocates its own buffers
+def element_polygons(tag, attrib):
+    polygons = []
+
+    # Rectangles
+    if tag == "rect":
+        x = float(attrib.get("x", 0))
+        y = float(attrib.get("y", 0))
+        w = float(attrib.get("width", 0))
+        h = float(attrib.get("height", 0))
+
+        # Convert from points to a polygon
+        poly = Polygon([(x, y), (x + w, y), (x + w, y + h), (x, y + h)])
+        polygons.append(poly)
+
+    # Circles
+    elif tag == "circle":
+        cx = float(attrib.get("cx", 0))
+        cy = float(attrib.get("cy", 0))
+        r = float(attrib.get("r", 0))
+        points = np.column_stack((cx + r * _COS, cy + r * _SIN))
+
+        # Convert from points to a polygon
+        poly = Polygon(points)
+        polygons.append(poly)
+
+    # Ellipses
+    elif tag == "ellipse":
+        cx = float(attrib.get('cx', 0))
+        cy = float(attrib.get('cy', 0))
+        rx = float(attrib.get('rx', 0))
+        ry = float(attrib.get('ry', 0))
+        points = np.column_stack((cx + rx * _COS, cy + ry * _SIN))
+
+        # Convert from points to a polygon
+        poly = Polygon(points)
+        polygons.append(poly)
+
+    # Any other path
+    elif tag == "path":
+
+        # Extract the path from the XML tree
+        data = attrib.get("d")
+        if not data:
+            return polygons
+        subpaths = parse_path_segments(data)
+
+        # Curves that are tiny compared to the whole path are not worth sampling
+        path_points = [
+            p for sub in subpaths for seg in sub
+            for p in ((seg[1], seg[-1]) if seg[0] == 'A' else seg[1:])
+        ]
+        min_extent = MIN_CURVE_EXTENT * taxicab_extent(path_points) if path_points else 0.0
+
+        # For each subpath, approximate with straight lines and write the points of each segment into the buffer
+        for sub in subpaths:
+
+            # Size the buffer for the subpath, counting a cubic like a sampled curve as most flatten to far fewer points
+            buf = np.empty((sum(2 if seg[0] == 'L' else CURVE_SAMPLES + 1 for seg in sub), 2))
+            idx = 0
+            for seg in sub:
+                kind = seg[0]
+                p0 = seg[1]
+                p3 = seg[-1]
+
+                # Replace tiny curves with their chord
+                if kind != 'L' and curve_extent(seg) < min_extent:
+                    kind = 'L'
+
+                # Grow the buffer if an earlier cubic used more than its share and this segment no longer fits
+                need = CURVE_SAMPLES + 1 if kind in 'QA' else 2
+                if idx + need > len(buf):
+                    buf = grow_buffer(buf, idx, need)
+
+                # Cubic Bézier segment has two control handles
+                if kind == 'C':
+                    p1, p2 = seg[2], seg[3]
+
+                    # Subdivide until every piece is flat enough to be a straight line, growing the buffer on overflow
+                    n = -1
+                    while n < 0:
+                        n = flatten_cubic(
+                            p0.real, p0.imag, p1.real, p1.imag,
+                            p2.real, p2.imag, p3.real, p3.imag,
+                            CURVE_TOLERANCE, MAX_SUBDIVISION_DEPTH, buf, idx,
+                        )
+                        if n < 0:
+                            buf = grow_buffer(buf, idx, 2)
+                    idx = n
+
+                # Quadratic Bézier segment has a single control handle
+                elif kind == 'Q':
+                    p1 = seg[2]
+
+                    # Sample every t at once, the product is written straight into the buffer
+                    cp = np.array([(p0.real, p0.imag), (p1.real, p1.imag), (p3.real, p3.imag)])
+                    np.matmul(_QUAD_BZ, cp, out=buf[idx:idx + need])
+                    idx += need
+
+                # Arc segment
+                elif kind == 'A':
+
+                    # Sample every t at once on the axis-aligned ellipse, then rotate and move onto the arc's center
+                    arc = Arc(*seg[1:])
+                    angle = np.radians(arc.theta + _T * arc.delta)
+                    local = np.column_stack((arc.radius.real * np.cos(angle), arc.radius.imag * np.sin(angle)))
+                    cos_rot, sin_rot = arc.rot_matrix.real, arc.rot_matrix.imag
+                    rotation = np.array([(cos_rot, sin_rot), (-sin_rot, cos_rot)])
+                    points = buf[idx:idx + need]
+                    np.matmul(local, rotation, out=points)
+                    points += (arc.center.real, arc.center.imag)
+                    idx += need
+
+                else:
+                    # Line segment (or fallback)
+                    buf[idx] = (p0.real, p0.imag)
+                    buf[idx + 1] = (p3.real, p3.imag)
+                    idx += 2
+
+            # Convert the filled part of the buffer to a polygon iff its a valid shape, shapely copies the points
+            if idx >= 3:
+                poly = Polygon(buf[:idx])
+                polygons.append(poly)
+
+    return polygons
+
+# Parse svg from a filepath or file object into a list of nested polygons
 def parse_svg_shapes(filepath):
-    tree = etree.parse(filepath)
-    root = tree.getroot()
     shapes = []
 
-    # Add a polygon to the list with initial nesting level 0
+    # Add a polygon to the list with initial nesting level 0, keeping its area for the final sum
     def add_polygon(poly):
-        if poly.is_valid and poly.area > 0:
-            shapes.append({'polygon': poly, 'nest_level': 0})
+        if not poly.is_valid:
+            return
+        area = poly.area
+        if area > 0:
+            shapes.append({'polygon': poly, 'nest_level': 0, 'area': area})
 
-    # Iterate over the svg elements using lxml to parse the XML document
-    for elem in root.iter():
+    # Stream the svg elements using lxml and hand each shape to the worker pool as soon as it is parsed
+    # NumPy, Numba and GEOS release the GIL, so sampling overlaps with parsing the rest of the document
+    futures = []
+    for _, elem in etree.iterparse(filepath, events=('end',)):
         tag = etree.QName(elem).localname
+        if tag in SHAPE_TAGS:
+            futures.append(_parse_pool.submit(element_polygons, tag, dict(elem.attrib)))
 
-        # Rectangles
-        if tag == "rect":
-            x = float(elem.attrib.get("x", 0))
-            y = float(elem.attrib.get("y", 0))
-            w = float(elem.attrib.get("width", 0))
-            h = float(elem.attrib.get("height", 0))
-            
-            # Convert from points to a polygon
-            poly = Polygon([(x, y), (x + w, y), (x + w, y + h), (x, y + h)])
-            add_polygon(poly)
+        # Free the element and any already processed siblings once its attributes are copied
+        elem.clear()
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
 
-        # Circles
-        elif tag == "circle":
-            cx = float(elem.attrib.get("cx", 0))
-            cy = float(elem.attrib.get("cy", 0))
-            r = float(elem.attrib.get("r", 0))
-            points = [
-                (
-                    cx + r * math.cos(2 * math.pi * i / CIRCLE_SAMPLES),
-                    cy + r * math.sin(2 * math.pi * i / CIRCLE_SAMPLES),
-                )
-                for i in range(CIRCLE_SAMPLES+1)
-            ]
-
-            # Convert from points to a polygon
-            poly = Polygon(points)
+    # Collect the polygons in document order
+    for future in futures:
+        for poly in future.result():
             add_polygon(poly)
 
-        # Ellipses
-        elif tag == "ellipse":
-            cx = float(elem.attrib.get('cx', 0))
-            cy = float(elem.attrib.get('cy', 0))
-            rx = float(elem.attrib.get('rx', 0))
-            ry = float(elem.attrib.get('ry', 0))
-            points = [
-                (
-                    cx + rx * math.cos(2 * math.pi * i / ELLIPSE_SAMPLES),
-                    cy + ry * math.cos(2 * math.pi * i / ELLIPSE_SAMPLES),
-                )
-                for i in range(ELLIPSE_SAMPLES+1)
-            ]
-            
-            # Convert from points to a polygon
-            poly = Polygon(points)
-            add_polygon(poly)
-
-        # Any other path
-        elif tag == "path":
-
-            # Extract the path from the XML tree
-            data = elem.attrib.get("d")
-            if not data:
-                continue
-            path = parse_path(data)
-
-            # For each subpath, approximate with straight lines and plot all points
-            for sub in path.continuous_subpaths():
-                points = []
-                for seg in sub:
-                    p0 = seg.start
-                    p3 = seg.end
-                    
-                    # Cubic Bézier segment has two control handles
-                    if hasattr(seg, "control1") and hasattr(seg, "control2"):
-                        p1 = seg.control1
-                        p2 = seg.control2
-
-                        # Sample using custom helper method
-                        for t in [i / CURVE_SAMPLES for i in range(CURVE_SAMPLES+1)]:
-                            x = bezier_point(p0.real, p1.real, p2.real, p3.real, t)
-                            y = bezier_point(p0.imag, p1.imag, p2.imag, p3.imag, t)
-                            points.append((x, y))
-
-                    # Arc segment has just one control handle
-                    elif seg.__class__.__name__ == "Arc":
-
-                        # Sample using the point() method
-                        for t in [i / CURVE_SAMPLES for i in range(CURVE_SAMPLES+1)]:
-                            pt = seg.point(t)
-                            points.append((pt.real, pt.imag))
-
-                    else:
-                        # Line segment (or fallback)
-                        points.append((p0.real, p0.imag))
-                        points.append((p3.real, p3.imag))
-
-                # Convert from points to a polygon iff its a valid shape
-                if len(points) >= 3:
-                    poly = Polygon(points)
-                    add_polygon(poly)
-
     return shapes
 
 # Calculate the sign for addition based on level of nesting inside other shapes
 # Overlaps don't need consideration because they would not from a valid CNC toolpath
 def compute_signed_area(shapes):
+
+    # Index the polygons so only shapes with overlapping bounding boxes are tested
+    tree = STRtree([shape["polygon"] for shape in shapes])
     for i, outer in enumerate(shapes):
-        for j, inner in enumerate(shapes):
-            if i != j and outer["polygon"].covers(inner["polygon"]):
+
+        # Prepare the outer polygon once so repeated covers() checks reuse its index
+        prepared = prep(outer["polygon"])
+        for j in tree.query(outer["polygon"]):
+            if i != j and prepared.covers(shapes[j]["polygon"]):
                 shapes[j]["nest_level"] += 1
 
     # Calculate the signed area to ensure only removed material is considered
     total_area = 0.0
     for shape in shapes:
         sign = 1 if shape["nest_level"] % 2 == 0 else -1
-        total_area += sign * shape["polygon"].area
+        total_area += sign * shape["area"]
     return total_area
 
+# Read an svg once, returning its contents and the digest that identifies them
+def read_svg(filepath):
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    return data, hashlib.blake2b(data).digest()
+
+# Parse an svg and store its polygons alongside it as WKB so later calculations can skip parsing
+# The artifact starts with the digest of the parsed contents and is swapped into place atomically
+def store_svg_shapes(filepath):
+    data, digest = read_svg(filepath)
+    shapes = parse_svg_shapes(io.BytesIO(data))
+    collection = GeometryCollection([shape["polygon"] for shape in shapes])
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath), suffix=SHAPES_ARTIFACT_SUFFIX)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(digest)
+            f.write(wkb.dumps(collection))
+        os.replace(tmp_path, filepath + SHAPES_ARTIFACT_SUFFIX)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# Load the polygons of an svg from its stored WKB when that was built from the same contents, otherwise parse them
+def load_svg_shapes(filepath, data, digest):
+    artifact_path = filepath + SHAPES_ARTIFACT_SUFFIX
+    if os.path.exists(artifact_path):
+        with open(artifact_path, 'rb') as f:
+            artifact = f.read()
+        if artifact[:len(digest)] == digest:
+            polygons = wkb.loads(artifact[len(digest):]).geoms
+            return [{'polygon': poly, 'nest_level': 0, 'area': poly.area} for poly in polygons]
+    return parse_svg_shapes(io.BytesIO(data))
+
+# Signed area of an SVG file, reusing the cached result when the same contents were calculated before
+def cached_signed_area(filepath):
+    data, digest = read_svg(filepath)
+    with _area_cache_lock:
+        area = _area_cache.pop(digest, None)
+    if area is None:
+        area = compute_signed_area(load_svg_shapes(filepath, data, digest))
+
+    # Re-insert as the newest entry and evict the least recently used ones
+    with _area_cache_lock:
+        _area_cache[digest] = area
+        while len(_area_cache) > AREA_CACHE_SIZE:
+            del _area_cache[next(iter(_area_cache))]
+    return area
+
 # Home endpoint
 @app.route('/')
 def home():
     return render_template('base.html')
 
+# Check the start of an uploaded file looks like SVG markup without reading the rest of it
+def looks_like_svg(file):
+    file.stream.seek(0)
+    head = file.stream.read(1024)
+    file.stream.seek(0)
+    return b'<svg' in head or b'<?xml' in head
+
 # Upload SVG file endpoint
 @app.route('/upload', methods=['POST'])
 def upload():
     file = request.files.get('svgfile')
-    if file and file.filename.endswith('.svg'):
+    if file and file.filename.endswith('.svg') and looks_like_svg(file):
         filename = secure_filename(SVG_FILENAME)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
+
+        # Parse the polygons now so calculations can skip it, any parse errors are reported when calculating
+        # A stale artifact left behind by a failure is ignored because its digest no longer matches
+        try:
+            store_svg_shapes(filepath)
+        except Exception:
+            pass
         flash('SVG uploaded successfully!', 'success')
     else:
         flash('Invalid file format. Please upload an SVG file.', 'error')
     return redirect(url_for('home'))
 
+# Oversized uploads are rejected by Werkzeug before the upload endpoint runs
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    flash(f"File too large. The maximum upload size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.", 'error')
+    return redirect(url_for('home'))
+
 # Caculate volume using both the user inputted depth and uploaded SVG file
 @app.route('/calculate', methods=['POST'])
 def calculate():
@@ -178,7 +554,7 @@ def calculate():
             raise ValueError("No depth entered.")
         if depth_input.startswith('.'):
             depth_input = '0' + depth_input
-        if not all(c.isdigit() or c == '.' for c in depth_input) or depth_input.count('.') > 1:
+        if not _DEPTH_RE.match(depth_input):
             raise ValueError("Invalid depth")
         depth = float(depth_input)
     except Exception as e:
@@ -192,8 +568,7 @@ def calculate():
 
     # Calculate the volume
     try:
-        shapes = parse_svg_shapes(stored_svg_path)
-        area_mm2 = compute_signed_area(shapes)
+        area_mm2 = cached_signed_area(stored_svg_path)
         volume_ml = area_mm2 * depth / 1000
         flash(f"Calculated volume: {volume_ml:.2f} ml", 'success')
     except Exception as e:
@@ -205,4 +580,4 @@ def calculate():
 # App entry point
 if __name__ == '__main__':
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    app.run(debug=True)
+    app.run(debug=os.environ.get('FLASK_ENV') == 'dev')
@@ -1,7 +1,7 @@
 import io
 import os
 import unittest
-from app import app, stored_svg_path
+from app import app, stored_svg_path, MAX_UPLOAD_BYTES, SHAPES_ARTIFACT_SUFFIX, _area_cache
 
 class SvgVolumeTestCase(unittest.TestCase):
 
@@ -13,8 +13,9 @@ class SvgVolumeTestCase(unittest.TestCase):
 
     # Clean any environment changes
     def tearDown(self):
-        if os.path.exists(stored_svg_path):
-            os.remove(stored_svg_path)
+        for path in (stored_svg_path, stored_svg_path + SHAPES_ARTIFACT_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
 
     # Helper function for loading the test svg files
     def load_svg_file(self, filename):
@@ -43,6 +44,48 @@ class SvgVolumeTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"Invalid file format", response.data)
 
+    # Test that uploading stores the parsed polygons and calculating uses them
+    def test_upload_stores_parsed_shapes(self):
+        svg_data = self.load_svg_file("Squares-200x200-100x100.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'Squares-200x200-100x100.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        self.assertTrue(os.path.exists(stored_svg_path + SHAPES_ARTIFACT_SUFFIX))
+        response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 300.00 ml", response.data)
+
+    # Test that stored polygons from different svg contents are ignored even when they look newer
+    def test_calculate_ignores_mismatched_parsed_shapes(self):
+        svg_data = self.load_svg_file("Square-200x200.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'Square-200x200.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        with open(stored_svg_path + SHAPES_ARTIFACT_SUFFIX, 'rb') as f:
+            stale_artifact = f.read()
+        svg_data = self.load_svg_file("Squares-200x200-100x100.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'Squares-200x200-100x100.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        with open(stored_svg_path + SHAPES_ARTIFACT_SUFFIX, 'wb') as f:
+            f.write(stale_artifact)
+        _area_cache.clear()
+        response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 300.00 ml", response.data)
+
+    # Test that files named .svg without svg content do not upload
+    def test_upload_non_svg_content(self):
+        self.tearDown()
+        data = {'svgfile': (io.BytesIO(b'\x89PNG\r\n\x1a\n not an svg'), 'Fake.svg')}
+        response = self.client.post("/upload", data=data, content_type='multipart/form-data', follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Invalid file format", response.data)
+        self.assertFalse(os.path.exists(stored_svg_path))
+
+    # Test that files over the upload limit are rejected
+    def test_upload_too_large(self):
+        self.tearDown()
+        data = {'svgfile': (io.BytesIO(b'<svg>' + b' ' * MAX_UPLOAD_BYTES), 'Large.svg')}
+        response = self.client.post("/upload", data=data, content_type='multipart/form-data', follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"File too large", response.data)
+        self.assertFalse(os.path.exists(stored_svg_path))
+
     # Calculation should not succeed without a valid svg files
     def test_calculate_without_upload(self):
         self.tearDown()
@@ -66,6 +109,22 @@ class SvgVolumeTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"Invalid depth", response.data)
     
+    # Calculation should not succeed with more than one decimal point
+    def test_calculate_multiple_decimal_points(self):
+        svg_data = self.load_svg_file("Square-200x200.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'Square-200x200.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        response = self.client.post("/calculate", data={"title": "1.2.3"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Invalid depth", response.data)
+    
+    # Depth with a leading decimal point (200mm*200mm*0.5mm = 20ml)
+    def test_calculate_leading_decimal_point(self):
+        svg_data = self.load_svg_file("Square-200x200.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'Square-200x200.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        response = self.client.post("/calculate", data={"title": ".5"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 20.00 ml", response.data)
+    
     # Simple cuboid calculation (200mm*200mm*10mm = 400ml)
     def test_calculate_valid_square(self):
         svg_data = self.load_svg_file("Square-200x200.svg")
@@ -90,6 +149,43 @@ class SvgVolumeTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"Calculated volume: 300.00 ml", response.data)
     
+    # Repeated and re-uploaded calculations should not reuse stale results
+    def test_calculate_repeated_and_reuploaded(self):
+        svg_data = self.load_svg_file("Squares-200x200-100x100.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'Squares-200x200-100x100.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        for _ in range(2):
+            response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+            self.assertIn(b"Calculated volume: 300.00 ml", response.data)
+        svg_data = self.load_svg_file("Square-200x200.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'Square-200x200.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 400.00 ml", response.data)
+    
+    # Nested cuboids drawn with relative path commands ((200mm*200mm) - (100mm*100mm)) * 10mm = 300ml
+    def test_calculate_valid_relative_path_commands(self):
+        svg_data = self.load_svg_file("RelativeSquares-200x200-100x100.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'RelativeSquares-200x200-100x100.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 300.00 ml", response.data)
+    
+    # Cuboid outline drawn as chained move and line pairs (100mm*100mm*10mm = 100ml)
+    def test_calculate_valid_chained_moves(self):
+        svg_data = self.load_svg_file("ChainedMoves-Square-100x100.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'ChainedMoves-Square-100x100.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 100.00 ml", response.data)
+    
+    # Tiny self-intersecting curve on a cuboid outline is replaced by its chord (200mm*200mm*10mm = 400ml)
+    def test_calculate_tiny_curve_replaced_by_chord(self):
+        svg_data = self.load_svg_file("TinyLoop-Square-200x200.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'TinyLoop-Square-200x200.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 400.00 ml", response.data)
+    
     # Irregular shape with straight sides (complexArea * 10mm = 354.6ml)
     def test_calculate_valid_irregular_shape(self):
         svg_data = self.load_svg_file("IrregularShape.svg")
@@ -114,6 +210,22 @@ class SvgVolumeTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"Calculated volume: 314", response.data)
     
+    # Circle element prism calculation ((pi*100mm^2) * 10mm = 314.xxml)
+    def test_calculate_valid_circle_element(self):
+        svg_data = self.load_svg_file("CircleElement-r100.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'CircleElement-r100.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 314", response.data)
+    
+    # Ellipse element prism calculation ((pi*100mm*50mm) * 10mm = 157.xxml)
+    def test_calculate_valid_ellipse_element(self):
+        svg_data = self.load_svg_file("Ellipse-rx100-ry50.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'Ellipse-rx100-ry50.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 157", response.data)
+    
     # Nested circlular prisms calculation ((pi*100mm^2) - (pi*50mm^2)) * 10mm = 235.xxml)
     def test_calculate_valid_nested_circles_1(self):
         svg_data = self.load_svg_file("Circles-r100-r50.svg")
@@ -130,6 +242,14 @@ class SvgVolumeTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b"Calculated volume: 274", response.data)
         
+    # Quadratic bezier arch calculation ((2/3 * 200mm * 100mm) * 10mm = 133.33ml)
+    def test_calculate_valid_quadratic_bezier(self):
+        svg_data = self.load_svg_file("QuadArch-w200-h100.svg")
+        self.client.post("/upload", data={'svgfile': (svg_data, 'QuadArch-w200-h100.svg')}, content_type='multipart/form-data', follow_redirects=True)
+        response = self.client.post("/calculate", data={"title": "10"}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Calculated volume: 133.33 ml", response.data)
+        
     # Test bezier curve accuracy using (pi*100mm^2) = 314.13159....
     def test_calculate_bezier_accuracy_1(self):
         svg_data = self.load_svg_file("BezCircle-r100.svg")
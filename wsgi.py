@@ -0,0 +1,6 @@
+import os
+from app import app
+
+# WSGI entry point for production servers, e.g. gunicorn -w 4 -k gthread --threads 8 wsgi:application
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+application = app